@@ -1,16 +1,637 @@
-__import__('pysqlite3')
-import sys
-sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+# Chroma (pulled in by crewai) needs sqlite >= 3.35; only swap in pysqlite3
+# where the system library is older, e.g. Streamlit Cloud
+import sqlite3
+if sqlite3.sqlite_version_info < (3, 35, 0):
+    import sys
+    import pysqlite3
+    sys.modules['sqlite3'] = pysqlite3
 
 import os
+import re
+import json
+import hashlib
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import diskcache
 import streamlit as st
-from crewai import Agent, Task, Crew, LLM
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import datetime
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Gemini settings. The agents write structured markdown from short briefs,
+# which the smallest tier handles well at a fraction of the latency and cost.
+MODEL_TIERS = {
+    "flash-8b": "gemini-1.5-flash-8b",
+    "flash": "gemini-1.5-flash",
+    "pro": "gemini-1.5-pro"
+}
+DEFAULT_MODEL_TIER = "flash-8b"
+
+# Generated plans are reused for identical trip details for a day
+PLAN_CACHE_DIR = "./.plan_cache"
+PLAN_CACHE_TTL = 86400  # seconds
+
+# LLM responses are memoized on disk for a day
+LLM_CACHE_DIR = "./.llm_cache"
+LLM_CACHE_TTL = 86400  # seconds
+
+# Progress labels shown while each agent works
+AGENT_LABELS = {
+    "transport": ("🚆 TransportAgent", "Finding transportation options..."),
+    "stay": ("🏨 StayAgent", "Researching accommodations..."),
+    "itinerary": ("📅 ItineraryAgent", "Creating daily schedule..."),
+    "budget": ("💸 BudgetAgent", "Calculating costs...")
+}
+
+# Icon and wording for how each agent finished
+AGENT_STATUSES = {
+    "done": ("✅", "done"),
+    "timeout": ("⏱️", "timed out"),
+    "error": ("❌", "failed")
+}
+
+# Agents that run longer than this are cancelled and their section is
+# left out, so one slow or failing call doesn't sink the whole plan
+AGENT_TIMEOUT_SECONDS = 45
+
+# Task templates. These stay free of trip details so the prompt prefix is
+# byte-identical across runs, which lets Gemini's implicit caching reuse it;
+# the trip context is appended at the end.
+TRANSPORT_TEMPLATE = """Research transportation options from the origin city to the destination.
+Provide:
+## 🚆 Transportation Options
+### ✈️ Flight Options
+- Airlines available
+- Duration and cost range
+- Best booking platforms
+### 🚂 Train Options
+- Train services available
+- Duration and cost
+- Booking tips
+### 🚌 Bus Options
+- Bus operators (government/private)
+- Duration and cost
+- Comfort levels
+### 🚗 Taxi/Car Options
+- Taxi services
+- Car rental options
+- Approximate costs
+### 🚇 Local Transport at the Destination
+- Public transport options
+- Auto/taxi rates
+- Transport passes available"""
+
+STAY_TEMPLATE = """Find 5-6 accommodation options at the destination for the traveler's budget type.
+Format:
+## 🏨 Accommodation Options
+### Option 1: [Hotel Name]
+**Type:** [Hotel/Resort/Guesthouse]
+**Price Range:** ₹X - ₹Y per night
+**Location:** [Area/neighborhood]
+**Rating:** [Star rating or review score]
+**Perks:**
+- [Advantage 1]
+- [Advantage 2]
+- [Advantage 3]
+**Cons:**
+- [Disadvantage 1]
+- [Disadvantage 2]
+[Continue for 5-6 options covering different price ranges within the budget category]"""
+
+ITINERARY_TEMPLATE = """Create a detailed itinerary for the destination covering every day of the trip.
+Focus on the traveler's interests.
+Format each day:
+## Day X: [Date] - [Theme]
+- 08:00 - 09:00: Breakfast at [place]
+- 09:00 - 11:00: [Activity with location]
+- 11:00 - 11:30: Travel/break time
+- 11:30 - 13:00: [Next activity]
+- 13:00 - 14:00: Lunch at [restaurant]
+- 14:00 - 16:00: [Afternoon activity]
+- 16:00 - 18:00: [Another activity]
+- 18:00 - 19:00: Rest/return to hotel
+- 19:00 - 21:00: Dinner at [restaurant]
+- 21:00 - 22:00: [Evening activity/rest]
+Include activities matching the traveler's interests."""
+
+BUDGET_TEMPLATE = """Calculate total cost estimation for this trip to the destination.
+Use the budget category given in the trip context.
+Base the estimate on typical current prices at the destination, including
+activities that match the traveler's interests.
+Calculate costs for:
+## 💸 Budget Breakdown
+### Transportation Costs
+- [From City] to [Destination]: ₹X - ₹Y
+- Local transport: ₹X per day
+### Accommodation Costs
+- Per night: ₹X - ₹Y
+- Total ([N] nights): ₹X - ₹Y
+### Food Costs
+- Breakfast: ₹X per day
+- Lunch: ₹X per day
+- Dinner: ₹X per day
+- Total food ([N] days): ₹X - ₹Y
+### Activity Costs
+- Entry fees and activities: ₹X - ₹Y
+### Miscellaneous
+- Shopping, tips, extras: ₹X - ₹Y
+## 💰 Final Estimation
+**Estimated total cost for a [budget type] trip is ₹X – ₹Y**"""
+
+# Transport, stay and itinerary are normally answered together in one JSON
+# response; their individual crews are only used if that response can't be parsed
+RESEARCH_KEYS = ("transport", "stay", "itinerary")
+RESEARCH_BATCH_TEMPLATE = (
+    'Answer all three briefs below in one JSON object with the keys "transport", "stay" '
+    'and "itinerary". Each value is a markdown string that follows its brief.\n\n'
+    '"transport":\n' + TRANSPORT_TEMPLATE + '\n\n'
+    '"stay":\n' + STAY_TEMPLATE + '\n\n'
+    '"itinerary":\n' + ITINERARY_TEMPLATE
+)
+
+# Dynamic tails appended after the static templates; crewai fills the
+# {placeholders} from the kickoff inputs. Research tasks only see the details
+# they use, so changing e.g. the budget type doesn't invalidate cached
+# transport or itinerary responses.
+TRANSPORT_CONTEXT_TEMPLATE = "\n\nContext: from={from_city}, to={destination}"
+STAY_CONTEXT_TEMPLATE = "\n\nContext: to={destination}, budget={budget_type}"
+ITINERARY_CONTEXT_TEMPLATE = "\n\nContext: to={destination}, days={trip_duration}, interests={interests}"
+TRIP_CONTEXT_TEMPLATE = (
+    "\n\nContext: from={from_city}, to={destination}, days={trip_duration}, "
+    "interests={interests}, budget={budget_type}"
+)
+
+# Agent and task definitions, keyed by agent. Goals stay free of trip details
+# so each agent's system prompt, the start of every request, is identical
+# across runs.
+AGENT_SPECS = {
+    "transport": {
+        "role": "Transportation Specialist",
+        "goal": "Find all transportation options between the traveler's origin city and destination",
+        "backstory": "Expert in finding the best transportation modes including buses, trains, flights, and local transport options."
+    },
+    "stay": {
+        "role": "Accommodation Specialist",
+        "goal": "Find 5-6 accommodation options at the destination that fit the traveler's budget type",
+        "backstory": "Hotel and accommodation expert who knows the best stays with detailed pros/cons analysis."
+    },
+    "itinerary": {
+        "role": "Itinerary Planning Specialist",
+        "goal": "Create a detailed day-wise itinerary covering every day of the trip",
+        "backstory": "Master itinerary planner who creates time-slot based daily schedules with activities matching traveler interests."
+    },
+    "budget": {
+        "role": "Budget Analysis Specialist",
+        "goal": "Calculate total trip cost estimation for the traveler's budget type",
+        "backstory": "Financial expert who accurately estimates travel costs including transport, accommodation, meals, and activities."
+    },
+    "research": {
+        "role": "Travel Research Specialist",
+        "goal": "Research transport, accommodation and a day-wise itinerary for the trip in one answer",
+        "backstory": "Travel researcher who covers transport, stays and day plans for a trip in a single pass."
+    }
+}
+TASK_SPECS = {
+    "transport": {
+        "description": TRANSPORT_TEMPLATE + TRANSPORT_CONTEXT_TEMPLATE,
+        "expected_output": "Comprehensive transportation guide with all modes of transport and costs"
+    },
+    "stay": {
+        "description": STAY_TEMPLATE + STAY_CONTEXT_TEMPLATE,
+        "expected_output": "5-6 detailed accommodation options with pros/cons, prices, and locations"
+    },
+    "itinerary": {
+        "description": ITINERARY_TEMPLATE + ITINERARY_CONTEXT_TEMPLATE,
+        "expected_output": "Complete {trip_duration}-day itinerary with time slots and activities"
+    },
+    # The budget estimate stands on its own, so it runs alongside the research
+    "budget": {
+        "description": BUDGET_TEMPLATE + TRIP_CONTEXT_TEMPLATE,
+        "expected_output": "Detailed budget breakdown with final cost estimation"
+    },
+    # One call answers all three research briefs as JSON
+    "research": {
+        "description": RESEARCH_BATCH_TEMPLATE + TRIP_CONTEXT_TEMPLATE,
+        "expected_output": "JSON object with transport, stay and itinerary markdown sections"
+    }
+}
+
+# Static description of the agents shown at the bottom of the page
+ARCHITECTURE_DESCRIPTION = """
+**🔎 ResearchAgent:** Researches transport, stays and the itinerary together in a single call:  
+- 🚆 Transport: travel options including bus, train, taxi, and local transport  
+- 🏨 Stay: 5–6 hotel options based on budget with pros/cons, location, price range  
+- 📅 Itinerary: day-wise plan with time slots (e.g., 8–9 AM breakfast)
+
+**🚆 TransportAgent, 🏨 StayAgent, 📅 ItineraryAgent:** Take over their sections separately if the combined answer can't be used  
+**💸 BudgetTrackerAgent:** Estimates overall trip cost based on stay type, transport, meals, etc., running alongside the research
+
+The finished sections are joined into the final plan as written, without another LLM call.
+"""
+
+# Templates for the merged plan and its download, rendered with format_map
+PLAN_HEADING_TEMPLATE = "# 🌍 Complete Travel Plan: {from_city} → {destination}\n\n"
+DOWNLOAD_MD_TEMPLATE = """# 🌍 Multi-Agent AI Travel Plan: {from_city} → {destination}
+**Generated by:** Research and budget AI agents
+**Date:** {generated_at}
+**Trip Dates:** {start_date} to {end_date}
+**Duration:** {trip_duration} days
+**Interests:** {interests}
+**Budget Type:** {budget_type}
+---
+{result_str}
+---
+*🧠 Generated using Multi-Agent Architecture:*
+- 🔎 ResearchAgent: Transportation, accommodation and day-wise scheduling in one pass
+- 💸 BudgetAgent: Cost estimation, alongside the research
+- Sections joined as written, without a coordinator LLM call
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def get_llm_cache():
+    """Open the on-disk LLM response cache once per server process."""
+    return diskcache.Cache(LLM_CACHE_DIR)
+
+
+LLM_RESPONSE_CACHE = get_llm_cache()
+
+# Set for the duration of a forced regeneration, so cached responses are
+# skipped and overwritten with fresh ones
+LLM_CACHE_REFRESH = contextvars.ContextVar("llm_cache_refresh", default=False)
+
+# Hit and miss counts for the plan being generated. diskcache's own stats
+# are shared by every session on the server, so each run counts its own.
+LLM_CACHE_COUNTS = contextvars.ContextVar("llm_cache_counts", default=None)
+
+# Keys stored while this is set are appended to it, so a caller can evict
+# responses it later finds unusable
+LLM_CACHE_WRITES = contextvars.ContextVar("llm_cache_writes", default=None)
+
+
+@st.cache_resource
+def get_llm(api_key, model, temperature=0.0, json_output=False):
+    """Build a Gemini LLM once per configuration, reusing it across reruns.
+
+    Temperature defaults to 0 so identical prompts give identical,
+    cacheable responses. json_output switches Gemini to JSON mode.
+    """
+    # crewai and litellm take seconds to import, so they are only loaded
+    # once a plan is generated rather than on every page load
+    from crewai import LLM
+    from litellm import supports_response_schema
+
+    class CachedLLM(LLM):
+        """crewai LLM that memoizes responses on disk, keyed by model, messages and temperature."""
+
+        def _response_cache_key(self, messages):
+            payload = {"model": self.model, "messages": messages, "temperature": self.temperature}
+            return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+        def _lookup(self, key):
+            response = None if LLM_CACHE_REFRESH.get() else LLM_RESPONSE_CACHE.get(key)
+            counts = LLM_CACHE_COUNTS.get()
+            if counts is not None:
+                counts["misses" if response is None else "hits"] += 1
+            return response
+
+        def _store(self, key, response):
+            if isinstance(response, str):
+                LLM_RESPONSE_CACHE.set(key, response, expire=LLM_CACHE_TTL)
+                writes = LLM_CACHE_WRITES.get()
+                if writes is not None:
+                    writes.append(key)
+
+        def call(self, messages, *args, **kwargs):
+            key = self._response_cache_key(messages)
+            response = self._lookup(key)
+            if response is None:
+                response = super().call(messages, *args, **kwargs)
+                self._store(key, response)
+            return response
+
+        async def acall(self, messages, *args, **kwargs):
+            # Used instead of call() when crews run through akickoff
+            key = self._response_cache_key(messages)
+            response = self._lookup(key)
+            if response is None:
+                response = await super().acall(messages, *args, **kwargs)
+                self._store(key, response)
+            return response
+
+    # crewai rejects response_format for models LiteLLM doesn't list as
+    # supporting it; those still get JSON from the prompt alone
+    json_mode = json_output and supports_response_schema(model=f"gemini/{model}", custom_llm_provider="gemini")
+
+    # crewai otherwise hands known Gemini models to its native client, which
+    # returns a different class and skips the caching overrides above
+    return CachedLLM(
+        model=f"gemini/{model}",
+        is_litellm=True,
+        api_key=api_key,
+        temperature=temperature,
+        custom_llm_provider="gemini",
+        response_format={"type": "json_object"} if json_mode else None
+    )
+
+
+@st.cache_resource
+def get_plan_cache():
+    """Open the on-disk plan cache once per server process."""
+    return diskcache.Cache(PLAN_CACHE_DIR)
+
+
+def plan_cache_key(from_city, destination, interests, budget_type, trip_duration, model):
+    """Hash the trip details and model that shape the generated plan."""
+    trip = {
+        "model": model,
+        "from": from_city.strip().lower(),
+        "to": destination.strip().lower(),
+        "interests": sorted(interest.strip() for interest in interests.lower().split(",")),
+        "budget": budget_type,
+        "days": trip_duration
+    }
+    return hashlib.sha256(json.dumps(trip, sort_keys=True).encode()).hexdigest()
+
+
+def compact_output(text):
+    """Trim trailing whitespace and collapse runs of blank lines in an agent output."""
+    lines = [line.rstrip() for line in str(text).splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def merge_plan(from_city, destination, sections):
+    """Join the agent outputs under one heading; they are already formatted markdown."""
+    return PLAN_HEADING_TEMPLATE.format_map({"from_city": from_city, "destination": destination}) + "\n\n".join(
+        compact_output(section) for section in sections
+    )
+
+
+@st.cache_data(show_spinner=False)
+def build_download_md(result_str, generated_at, from_city, destination, start_date, end_date, trip_duration, interests, budget_type):
+    """Assemble the downloadable markdown for a finished plan, encoded once as UTF-8 bytes."""
+    return DOWNLOAD_MD_TEMPLATE.format_map({
+        "result_str": result_str,
+        "from_city": from_city,
+        "destination": destination,
+        "generated_at": generated_at,
+        "start_date": start_date,
+        "end_date": end_date,
+        "trip_duration": trip_duration,
+        "interests": interests,
+        "budget_type": budget_type
+    }).encode("utf-8")
+
+
+def show_progress(placeholder, outcomes):
+    """Render every agent's progress line in a single markdown update.
+
+    outcomes maps finished agents to (status, detail); detail is only
+    shown for agents that timed out or failed.
+    """
+    lines = []
+    for key, (label, activity) in AGENT_LABELS.items():
+        if key not in outcomes:
+            lines.append(f"{label}: {activity}")
+            continue
+        status, detail = outcomes[key]
+        icon, outcome = AGENT_STATUSES[status]
+        lines.append(f"{icon} {label}: {outcome}" + (f" ({detail})" if status != "done" else ""))
+    placeholder.markdown("\n\n".join(lines))
+
+
+def show_agent_output(container, key, output):
+    """Add a finished agent's section below the progress lines as a collapsed expander."""
+    icon, outcome = AGENT_STATUSES["done"]
+    container.expander(f"{icon} {AGENT_LABELS[key][0]}: {outcome}").markdown(str(output))
+
+
+def new_crew(agents, tasks):
+    """Build a crew with tool-call memoization on and vector-store memory off."""
+    from crewai import Crew
+
+    return Crew(agents=agents, tasks=tasks, cache=True, memory=False, verbose=False)
+
+
+async def kickoff_crew(crew, inputs):
+    """Run a crew on the current event loop with the given template inputs."""
+    # akickoff awaits LLM calls natively; older crewai releases only offer
+    # kickoff_async, which runs the synchronous kickoff in a worker thread
+    if hasattr(crew, "akickoff"):
+        return await crew.akickoff(inputs=inputs)
+    return await crew.kickoff_async(inputs=inputs)
+
+
+async def kickoff_guarded(crew, inputs, timeout=AGENT_TIMEOUT_SECONDS):
+    """Run a crew with a timeout and return (status, output) instead of raising.
+
+    A failed crew's output is the exception itself, so it can still be
+    raised if no agent succeeds.
+    """
+    try:
+        return "done", await asyncio.wait_for(kickoff_crew(crew, inputs), timeout)
+    except asyncio.TimeoutError:
+        return "timeout", f"No response within {AGENT_TIMEOUT_SECONDS} seconds"
+    except Exception as e:
+        return "error", e
+
+
+async def kickoff_parallel(crews, inputs, on_complete, timeout=AGENT_TIMEOUT_SECONDS):
+    """Kick off independent crews concurrently and return (status, output) pairs by key."""
+    async def kickoff_and_report(key, crew):
+        status, output = await kickoff_guarded(crew, inputs, timeout)
+        on_complete(key, status, output)
+        return status, output
+
+    results = await asyncio.gather(*(kickoff_and_report(key, crew) for key, crew in crews.items()))
+    return dict(zip(crews, results))
+
+
+def parse_research_batch(output):
+    """Split the batched research answer into transport, stay and itinerary, or None if unusable."""
+    # Strip a ```json fence in case the model wraps its answer anyway
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", str(output).strip())
+    try:
+        sections = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(sections, dict) or not all(isinstance(sections.get(key), str) for key in RESEARCH_KEYS):
+        return None
+    return [sections[key] for key in RESEARCH_KEYS]
+
+
+def build_travel_crews(llm, research_llm):
+    """Build the research and budget crews; trip details arrive later as kickoff inputs."""
+    from crewai import Agent, Task
+
+    agents = {
+        key: Agent(
+            **spec,
+            llm=research_llm if key == "research" else llm,
+            verbose=False,
+            allow_delegation=False
+        )
+        for key, spec in AGENT_SPECS.items()
+    }
+    tasks = {key: Task(**spec, agent=agents[key]) for key, spec in TASK_SPECS.items()}
+
+    # Each agent gets its own crew so the independent ones can run in parallel
+    return {key: new_crew([agents[key]], [task]) for key, task in tasks.items()}
+
+
+async def run_travel_crews(crews, trip_inputs, progress_placeholder, output_container):
+    """Run the research and budget crews side by side.
+
+    Returns the transport, stay, itinerary and budget sections in that
+    order, plus the keys of any agents that timed out or failed. Their
+    sections are replaced by a short placeholder. If every agent fails,
+    the first error is raised instead, so e.g. a bad API key still
+    reaches the caller.
+
+    Progress is reported after each await, which resumes on the script
+    thread, so progress_placeholder and output_container can be updated.
+    Each finished section is shown in output_container as soon as it
+    arrives.
+    """
+    sections = {}
+    outcomes = {}
+    failed = []
+
+    def record(key, status, output):
+        outcomes[key] = (status, output)
+        if status == "done":
+            sections[key] = output
+            show_agent_output(output_container, key, output)
+        else:
+            sections[key] = f"*[{AGENT_LABELS[key][0]} section unavailable]*"
+            failed.append(key)
+
+    def report(key, status, output):
+        record(key, status, output)
+        show_progress(progress_placeholder, outcomes)
+
+    async def research():
+        # Transport, stay and itinerary don't depend on each other, so one call
+        # answers all three. If that call times out or fails, all three
+        # sections are marked rather than retried. Only when it answers with
+        # unusable JSON do their own crews run, in parallel and within what is
+        # left of the same time limit.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AGENT_TIMEOUT_SECONDS
+        batch_writes = []
+        writes_token = LLM_CACHE_WRITES.set(batch_writes)
+        status, output = await kickoff_guarded(crews["research"], trip_inputs)
+        LLM_CACHE_WRITES.reset(writes_token)
+        if status != "done":
+            for key in RESEARCH_KEYS:
+                record(key, status, output)
+            show_progress(progress_placeholder, outcomes)
+            return
+
+        research_results = parse_research_batch(output)
+        if research_results is None:
+            # Don't replay an unusable batch answer from the cache next time
+            for key in batch_writes:
+                LLM_RESPONSE_CACHE.delete(key)
+            research_crews = {key: crews[key] for key in RESEARCH_KEYS}
+            await kickoff_parallel(research_crews, trip_inputs, on_complete=report, timeout=deadline - loop.time())
+        else:
+            for key, output in zip(RESEARCH_KEYS, research_results):
+                record(key, "done", output)
+            show_progress(progress_placeholder, outcomes)
+
+    async def budget():
+        report("budget", *await kickoff_guarded(crews["budget"], trip_inputs))
+
+    await asyncio.gather(research(), budget())
+    if len(failed) == len(AGENT_LABELS):
+        errors = [detail for status, detail in outcomes.values() if status == "error"]
+        raise errors[0] if errors else TimeoutError(f"No agent responded within {AGENT_TIMEOUT_SECONDS} seconds")
+    return [sections[key] for key in AGENT_LABELS], failed
+
+
+def run_async(coro):
+    """Run a coroutine to completion on a fresh event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    # This thread is already running a loop, so drive ours from a helper
+    # thread that shares the script and context variables and can still
+    # update the page
+    with ThreadPoolExecutor(max_workers=1, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())) as pool:
+        return pool.submit(contextvars.copy_context().run, run_async, coro).result()
+
+
+def generate_plan(api_key, model, trip_inputs, force_regenerate=False):
+    """Return the merged plan for a trip and the keys of any agents that didn't finish.
+
+    Complete plans are stored on disk by trip details and model, so an
+    identical submission skips crewai, the LLM and the network entirely.
+    """
+    plan_cache = get_plan_cache()
+    cache_key = plan_cache_key(**trip_inputs, model=model)
+    result = None if force_regenerate else plan_cache.get(cache_key)
+    if result is not None:
+        return result, []
+
+    # Initialize LLM
+    gemini_llm = get_llm(api_key, model)
+    research_llm = get_llm(api_key, model, json_output=True)
+
+    # Agents, tasks and crews are built once per session and reused
+    # until the model they were built for changes
+    travel_crews = st.session_state.get("travel_crews")
+    if travel_crews is None or travel_crews["model"] != model:
+        travel_crews = {
+            "model": model,
+            "crews": build_travel_crews(gemini_llm, research_llm)
+        }
+        st.session_state.travel_crews = travel_crews
+
+    # All agents share one progress placeholder, re-rendered as each
+    # finishes; finished sections are added below it as they arrive
+    progress_area = st.empty()
+    with progress_area.container():
+        progress_placeholder = st.empty()
+        output_container = st.container()
+    show_progress(progress_placeholder, {})
+
+    # Execute multi-agent workflow
+    llm_cache_counts = {"hits": 0, "misses": 0}
+    counts_token = LLM_CACHE_COUNTS.set(llm_cache_counts)
+    refresh_token = LLM_CACHE_REFRESH.set(force_regenerate)
+    try:
+        sections, failed_agents = run_async(run_travel_crews(travel_crews["crews"], trip_inputs, progress_placeholder, output_container))
+    finally:
+        LLM_CACHE_REFRESH.reset(refresh_token)
+        LLM_CACHE_COUNTS.reset(counts_token)
+    # Keep the status lines up when an agent timed out or failed, so the
+    # user can see which ones and why
+    if not failed_agents:
+        progress_area.empty()
+
+    llm_cache_stats = st.session_state.setdefault("llm_cache_stats", {"hits": 0, "misses": 0})
+    llm_cache_stats["hits"] += llm_cache_counts["hits"]
+    llm_cache_stats["misses"] += llm_cache_counts["misses"]
+
+    # The sections are already formatted, so merging them needs no LLM call
+    result = merge_plan(trip_inputs["from_city"], trip_inputs["destination"], sections)
+    # Partial plans aren't saved, so the next attempt retries the missing agents
+    if not failed_agents:
+        plan_cache.set(cache_key, result, expire=PLAN_CACHE_TTL)
+    return result, failed_agents
+
+
 # Streamlit page config
 st.set_page_config(
     page_title="🌍 PlanMyTrip",
@@ -30,275 +651,110 @@ else:
     st.error("❌ API Key not found!")
     st.info("Please make sure you have a .env file with GEMINI_API_KEY=your_key")
 
-# Trip details inputs
+# Gemini model used by every agent
+model_tier = st.sidebar.selectbox(
+    "Model tier",
+    list(MODEL_TIERS),
+    index=list(MODEL_TIERS).index(DEFAULT_MODEL_TIER),
+    help="Smaller tiers respond faster and cost less; larger ones write more detailed plans"
+)
+gemini_model = MODEL_TIERS[model_tier]
+
+# Trip details inputs. The form holds back reruns until it is submitted,
+# so typing in a field doesn't re-execute the whole script.
 st.markdown("### 📋 Trip Details")
-col1, col2 = st.columns(2)
+with st.form("trip_form"):
+    col1, col2 = st.columns(2)
+
+    with col1:
+        from_city = st.text_input("From City", placeholder="Chennai")
+        destination = st.text_input("Destination", placeholder="Goa")
+        interests = st.text_input("Interests", placeholder="beaches, nightlife, food")
 
-with col1:
-    from_city = st.text_input("From City", placeholder="Chennai")
-    destination = st.text_input("Destination", placeholder="Goa")
-    interests = st.text_input("Interests", placeholder="beaches, nightlife, food")
+    with col2:
+        start_date = st.date_input("Start Date")
+        end_date = st.date_input("End Date")
+        budget_type = st.selectbox("Budget Type", ["budget", "moderate", "luxury"])
 
-with col2:
-    start_date = st.date_input("Start Date")
-    end_date = st.date_input("End Date")
-    budget_type = st.selectbox("Budget Type", ["budget", "moderate", "luxury"])
+    force_regenerate = st.checkbox("🔁 Force regenerate", help="Ignore any saved plan for these trip details")
+    # Generate travel plan button
+    generate = st.form_submit_button("🚀 Generate Multi-Agent Travel Plan", type="primary")
 
 # Calculate trip duration
 if start_date and end_date:
     trip_duration = (end_date - start_date).days
     st.info(f"Trip Duration: {trip_duration} days")
 
-# Generate travel plan button
-if st.button("🚀 Generate Multi-Agent Travel Plan", type="primary"):
-    if from_city and destination and interests and trip_duration > 0:
-        if gemini_api_key:
-            with st.spinner("🤖 Multi-Agent system is working..."):
-                try:
-                    # Initialize LLM
-                    gemini_llm = LLM(
-                        model="gemini/gemini-1.5-flash",
-                        api_key=gemini_api_key,
-                        temperature=0.3,
-                        custom_llm_provider="gemini"
-                    )
-
-                    # Initialize Agents
-                    transport_agent = Agent(
-                        role="Transportation Specialist",
-                        goal=f"Find all transportation options from {from_city} to {destination}",
-                        backstory="Expert in finding the best transportation modes including buses, trains, flights, and local transport options.",
-                        llm=gemini_llm,
-                        verbose=False,
-                        allow_delegation=False
-                    )
-
-                    stay_agent = Agent(
-                        role="Accommodation Specialist",
-                        goal=f"Find 5-6 accommodation options in {destination} for {budget_type} travelers",
-                        backstory="Hotel and accommodation expert who knows the best stays with detailed pros/cons analysis.",
-                        llm=gemini_llm,
-                        verbose=False,
-                        allow_delegation=False
-                    )
-
-                    itinerary_agent = Agent(
-                        role="Itinerary Planning Specialist",
-                        goal=f"Create detailed day-wise itinerary for {trip_duration} days in {destination}",
-                        backstory="Master itinerary planner who creates time-slot based daily schedules with activities matching traveler interests.",
-                        llm=gemini_llm,
-                        verbose=False,
-                        allow_delegation=False
-                    )
-
-                    budget_agent = Agent(
-                        role="Budget Analysis Specialist",
-                        goal=f"Calculate total trip cost estimation for {budget_type} travel",
-                        backstory="Financial expert who accurately estimates travel costs including transport, accommodation, meals, and activities.",
-                        llm=gemini_llm,
-                        verbose=False,
-                        allow_delegation=False
-                    )
-
-                    coordinator_agent = Agent(
-                        role="Travel Plan Coordinator",
-                        goal="Merge all agent outputs into one clean, readable final travel plan",
-                        backstory="Master coordinator who combines all travel information into a comprehensive, well-organized final plan.",
-                        llm=gemini_llm,
-                        verbose=False,
-                        allow_delegation=False
-                    )
-
-                    # Define Tasks
-                    transport_task = Task(
-                        description=f"""
-                        Research transportation options from {from_city} to {destination}.
-                        Provide:
-                        ## 🚆 Transportation Options
-                        ### ✈️ Flight Options
-                        - Airlines available
-                        - Duration and cost range
-                        - Best booking platforms
-                        ### 🚂 Train Options
-                        - Train services available
-                        - Duration and cost
-                        - Booking tips
-                        ### 🚌 Bus Options
-                        - Bus operators (government/private)
-                        - Duration and cost
-                        - Comfort levels
-                        ### 🚗 Taxi/Car Options
-                        - Taxi services
-                        - Car rental options
-                        - Approximate costs
-                        ### 🚇 Local Transport in {destination}
-                        - Public transport options
-                        - Auto/taxi rates
-                        - Transport passes available
-                        """,
-                        expected_output="Comprehensive transportation guide with all modes of transport and costs",
-                        agent=transport_agent
-                    )
-
-                    stay_task = Task(
-                        description=f"""
-                        Find 5-6 accommodation options in {destination} for {budget_type} travelers.
-                        Format:
-                        ## 🏨 Accommodation Options
-                        ### Option 1: [Hotel Name]
-                        **Type:** [Hotel/Resort/Guesthouse]
-                        **Price Range:** ₹X - ₹Y per night
-                        **Location:** [Area/neighborhood]
-                        **Rating:** [Star rating or review score]
-                        **Perks:**
-                        - [Advantage 1]
-                        - [Advantage 2]
-                        - [Advantage 3]
-                        **Cons:**
-                        - [Disadvantage 1]
-                        - [Disadvantage 2]
-                        [Continue for 5-6 options covering different price ranges within {budget_type} category]
-                        """,
-                        expected_output="5-6 detailed accommodation options with pros/cons, prices, and locations",
-                        agent=stay_agent
-                    )
-
-                    itinerary_task = Task(
-                        description=f"""
-                        Create a {trip_duration}-day detailed itinerary for {destination}.
-                        Focus on interests: {interests}
-                        Format each day:
-                        ## Day X: [Date] - [Theme]
-                        - 08:00 - 09:00: Breakfast at [place]
-                        - 09:00 - 11:00: [Activity with location]
-                        - 11:00 - 11:30: Travel/break time
-                        - 11:30 - 13:00: [Next activity]
-                        - 13:00 - 14:00: Lunch at [restaurant]
-                        - 14:00 - 16:00: [Afternoon activity]
-                        - 16:00 - 18:00: [Another activity]
-                        - 18:00 - 19:00: Rest/return to hotel
-                        - 19:00 - 21:00: Dinner at [restaurant]
-                        - 21:00 - 22:00: [Evening activity/rest]
-                        Include activities matching: {interests}
-                        """,
-                        expected_output=f"Complete {trip_duration}-day itinerary with time slots and activities",
-                        agent=itinerary_agent
-                    )
-
-                    budget_task = Task(
-                        description=f"""
-                        Calculate total cost estimation for this {trip_duration}-day trip to {destination}.
-                        Budget category: {budget_type}
-                        Calculate costs for:
-                        ## 💸 Budget Breakdown
-                        ### Transportation Costs
-                        - {from_city} to {destination}: ₹X - ₹Y
-                        - Local transport: ₹X per day
-                        ### Accommodation Costs
-                        - Per night: ₹X - ₹Y
-                        - Total ({trip_duration} nights): ₹X - ₹Y
-                        ### Food Costs
-                        - Breakfast: ₹X per day
-                        - Lunch: ₹X per day
-                        - Dinner: ₹X per day
-                        - Total food ({trip_duration} days): ₹X - ₹Y
-                        ### Activity Costs
-                        - Entry fees and activities: ₹X - ₹Y
-                        ### Miscellaneous
-                        - Shopping, tips, extras: ₹X - ₹Y
-                        ## 💰 Final Estimation
-                        **Estimated total cost for a {budget_type} trip is ₹X – ₹Y**
-                        """,
-                        expected_output="Detailed budget breakdown with final cost estimation",
-                        agent=budget_agent,
-                        context=[transport_task, stay_task, itinerary_task]
-                    )
-
-                    coordinator_task = Task(
-                        description=f"""
-                        Merge all the outputs from transport, accommodation, itinerary, and budget agents into one clean, readable final travel plan.
-                        Create a comprehensive plan with:
-                        # 🌍 Complete Travel Plan: {from_city} → {destination}
-                        [Include all sections from other agents in a well-organized manner]
-                        Make it clean, readable, and professional.
-                        """,
-                        expected_output="Complete, well-organized travel plan combining all agent outputs",
-                        agent=coordinator_agent,
-                        context=[transport_task, stay_task, itinerary_task, budget_task]
-                    )
-
-                    # Initialize Crew
-                    travel_crew = Crew(
-                        agents=[transport_agent, stay_agent, itinerary_agent, budget_agent, coordinator_agent],
-                        tasks=[transport_task, stay_task, itinerary_task, budget_task, coordinator_task],
-                        verbose=False
-                    )
-
-                    # Show progress placeholders
-                    progress_placeholder = st.empty()
-                    with progress_placeholder.container():
-                        st.write("🚆 TransportAgent: Finding transportation options...")
-                        st.write("🏨 StayAgent: Researching accommodations...")
-                        st.write("📅 ItineraryAgent: Creating daily schedule...")
-                        st.write("💸 BudgetAgent: Calculating costs...")
-                        st.write("🔄 CoordinatorAgent: Merging everything...")
-
-                    # Execute multi-agent workflow
-                    result = travel_crew.kickoff()
-                    progress_placeholder.empty()
-
-                    # Show final result
-                    st.success("🎉 Multi-Agent Travel Plan Complete!")
-                    st.markdown("---")
-                    st.markdown("## 🗺️ Your Complete Multi-Agent Travel Plan")
-                    st.markdown(str(result))
-
-                    # Prepare downloadable markdown
-                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"multi_agent_travel_plan_{destination.replace(' ', '_')}_{timestamp}.md"
-
-                    download_content = f"""
-                    # 🌍 Multi-Agent AI Travel Plan: {from_city} → {destination}
-                    **Generated by:** 5 Specialized AI Agents
-                    **Date:** {datetime.datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-                    **Trip Dates:** {start_date} to {end_date}
-                    **Duration:** {trip_duration} days
-                    **Interests:** {interests}
-                    **Budget Type:** {budget_type}
-                    ---
-                    {str(result)}
-                    ---
-                    *🧠 Generated using Multi-Agent Architecture:*
-                    - 🚆 TransportAgent: Transportation options
-                    - 🏨 StayAgent: Accommodation recommendations
-                    - 📅 ItineraryAgent: Day-wise scheduling
-                    - 💸 BudgetAgent: Cost estimation
-                    - 🔄 CoordinatorAgent: Final plan coordination
-                    """
-
-                    st.download_button(
-                        label="📥 Download Multi-Agent Travel Plan",
-                        data=download_content,
-                        file_name=filename,
-                        mime="text/markdown"
-                    )
-
-                    st.info(f"💾 Multi-agent travel plan saved as: {filename}")
-
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
-                    st.info("💡 Please check your API key and try again")
-        else:
-            st.error("❌ API Key not found!")
-    else:
-        st.warning("⚠️ Please fill in all required fields and ensure end date is after start date!")
+# Validate before building any LLM, agent or crew objects. An invalid
+# submission only skips generation; the rest of the page still renders.
+if generate and not (from_city and destination and interests and trip_duration > 0):
+    st.warning("⚠️ Please fill in all required fields and ensure end date is after start date!")
+elif generate and not gemini_api_key:
+    st.error("❌ API Key not found!")
+elif generate:
+    # Trip details are filled into the task templates by crewai
+    trip_inputs = {
+        "from_city": from_city,
+        "destination": destination,
+        "trip_duration": trip_duration,
+        "interests": interests,
+        "budget_type": budget_type
+    }
+
+    with st.spinner("🤖 Multi-Agent system is working..."):
+        try:
+            result, failed_agents = generate_plan(gemini_api_key, gemini_model, trip_inputs, force_regenerate)
+
+            # Keep the plan in session state so it survives reruns. The time is
+            # read once so the filename and the download header always agree.
+            now = datetime.datetime.now()
+            destination_slug = destination.replace(" ", "_")
+            st.session_state.travel_plan = {
+                "result": result,
+                "filename": f"multi_agent_travel_plan_{destination_slug}_{now.strftime('%Y%m%d_%H%M%S')}.md",
+                "generated_at": now.strftime("%B %d, %Y at %I:%M %p"),
+                "trip": {
+                    "from_city": from_city,
+                    "destination": destination,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "trip_duration": trip_duration,
+                    "interests": interests,
+                    "budget_type": budget_type
+                }
+            }
+            if failed_agents:
+                missing = ", ".join(AGENT_LABELS[key][0] for key in failed_agents)
+                st.warning(f"⚠️ Travel plan is partial; these agents didn't finish: {missing}")
+            else:
+                st.success("🎉 Multi-Agent Travel Plan Complete!")
+
+        except Exception as e:
+            st.error(f"❌ Error: {str(e)}")
+            st.info("💡 Please check your API key and try again")
+
+# LLM response cache activity for this session
+if "llm_cache_stats" in st.session_state:
+    llm_cache_stats = st.session_state.llm_cache_stats
+    st.sidebar.caption(f"🗄️ LLM cache: {llm_cache_stats['hits']} hits / {llm_cache_stats['misses']} misses")
+
+# Show the latest travel plan
+travel_plan = st.session_state.get("travel_plan")
+if travel_plan:
+    result_str = travel_plan["result"]
+    st.markdown("---")
+    st.markdown("## 🗺️ Your Complete Multi-Agent Travel Plan")
+    st.markdown(result_str)
+
+    st.download_button(
+        label="📥 Download Multi-Agent Travel Plan",
+        data=build_download_md(result_str, travel_plan["generated_at"], **travel_plan["trip"]),
+        file_name=travel_plan["filename"],
+        mime="text/markdown"
+    )
+
+    st.info(f"💾 Multi-agent travel plan saved as: {travel_plan['filename']}")
 
 # Multi-Agent Architecture Info
 st.markdown("### 🧠 Multi-Agent Architecture")
-st.markdown("""
-**🔄 CoordinatorAgent:** Merges outputs from all agents into clean, readable final plan  
-**🚆 TransportAgent:** Suggests travel options including bus, train, taxi, and local transport  
-**🏨 StayAgent:** Provides 5–6 hotel options based on budget with pros/cons, location, price range  
-**📅 ItineraryAgent:** Creates day-wise itinerary with time slots (e.g., 8–9 AM breakfast)  
-**💸 BudgetTrackerAgent:** Estimates overall trip cost based on stay type, transport, meals, etc.
-""")
+st.markdown(ARCHITECTURE_DESCRIPTION)